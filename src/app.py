@@ -22,21 +22,37 @@
 
 from __future__ import annotations
 
+import functools
 import json
 import logging
 import os
+import queue
 import random
+
+try:
+    # Serializa escrituras de state.json entre workers de gunicorn (POSIX).
+    import fcntl
+except ImportError:
+    fcntl = None
 import re
-import tempfile
 import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from threading import Lock
-from typing import Dict, List, Optional, Set, Tuple
+from threading import Lock, Thread
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+try:
+    # Acelera 3-10x la (de)serialización de state.json; opcional.
+    import orjson
+except ImportError:
+    orjson = None
 
 import requests
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request
+from requests.adapters import HTTPAdapter, Retry
 from requests.exceptions import RequestException
 
 # Modelo POO existente
@@ -108,53 +124,318 @@ class Ctx:
     club: Club
     state_store: "StateStore"
     club_file: Path
-    admins: Set[str]
+    admins: FrozenSet[str]
     all_numbers: Tuple[str, ...]
     members_index: Set[str]
+    name_by_waid: Dict[str, str]
+    members_by_waid: Dict[str, Member]
+    members_by_norm_name: Dict[str, Member]
+    # Pares (waid, nivel) planos para los loops calientes de elección: evita
+    # dos LOAD_ATTR por miembro por rol. Se refresca si cambia padrón o nivel.
+    member_levels: Tuple[Tuple[str, int], ...]
+    roles_by_name: Dict[str, Role]
+    # Los roles no cambian en runtime; el orden congelado sirve a resúmenes y
+    # rondas, y el frozenset a los chequeos de completitud.
+    role_names: Tuple[str, ...]
+    role_names_set: FrozenSet[str]
+    # (huella, texto) del último resumen armado; ver make_summary.
+    summary_cache: Optional[Tuple[tuple, str]] = None
+    # Hay un guardado de club.json encolado; ver _save_club_async.
+    club_save_pending: bool = False
+
+
+# (mtime, dict) del último registry.json parseado; evita re-parsear en recargas.
+_REGISTRY_CACHE: Optional[Tuple[float, dict]] = None
 
 
 def load_registry() -> dict:
-    if REGISTRY_FILE.exists():
-        return json.loads(REGISTRY_FILE.read_text(encoding="utf-8"))
-    return {"clubs": {}}
+    global _REGISTRY_CACHE
+    if not REGISTRY_FILE.exists():
+        return {"clubs": {}}
+    mtime = REGISTRY_FILE.stat().st_mtime
+    if _REGISTRY_CACHE is None or _REGISTRY_CACHE[0] != mtime:
+        _REGISTRY_CACHE = (mtime, _json_loads(REGISTRY_FILE.read_bytes()))
+    return _REGISTRY_CACHE[1]
+
+
+def _json_default(o):
+    # members_cycle vive como sets en memoria; a disco van como listas.
+    if isinstance(o, (set, frozenset)):
+        return sorted(o)
+    raise TypeError(f"No serializable: {type(o).__name__}")
+
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+# JSON compacto en el camino caliente; STATE_PRETTY_JSON=1 re-activa indentado
+# para depurar a mano los state.json.
+_STATE_JSON_INDENT = 2 if os.getenv("STATE_PRETTY_JSON") == "1" else None
+_fdatasync = getattr(os, "fdatasync", os.fsync)
 
+# Cada save() agrega UNA línea al journal state.jsonl (append + fdatasync) en
+# vez de reescribir state.json entero (tmp + rename + fsync del dir). Cada N
+# eventos se compacta: snapshot completo atómico y journal en cero.
+_JOURNAL_COMPACT_EVERY = int(os.getenv("STATE_JOURNAL_COMPACT_EVERY", "200"))
 
-def _dump_json_atomic(path: Path, obj: dict) -> None:
+
+def _encode_state(obj: dict) -> bytes:
+    if orjson is not None and _STATE_JSON_INDENT is None:
+        return orjson.dumps(obj, default=_json_default)
+    return json.dumps(
+        obj, ensure_ascii=False, indent=_STATE_JSON_INDENT, default=_json_default
+    ).encode("utf-8")
+
+
+def _encode_state_line(obj: dict) -> bytes:
+    # Siempre compacto: las líneas del journal deben caber en una sola línea.
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default)
+    return json.dumps(obj, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def _write_bytes_atomic(path: Path, payload: bytes) -> None:
+    """Escritura atómica y durable: tmp + fdatasync + os.replace + fsync del dir.
+
+    Con varios workers (gunicorn) el flock serializa a los escritores del
+    mismo archivo; el Lock del StateStore solo cubre los hilos del proceso.
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
-    with tempfile.NamedTemporaryFile("w", delete=False, dir=path.parent, encoding="utf-8") as tmp:
-        json.dump(obj, tmp, ensure_ascii=False, indent=2)
-        tmp_path = Path(tmp.name)
-    os.replace(tmp_path, path)
+    if fcntl is not None:
+        with open(path.with_suffix(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _write_bytes_atomic_unlocked(path, payload)
+    else:
+        _write_bytes_atomic_unlocked(path, payload)
+
+
+def _write_bytes_atomic_unlocked(path: Path, payload: bytes) -> None:
+    tmp = str(path) + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, payload)
+        _fdatasync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _append_line_durable(journal_path: Path, line: bytes) -> None:
+    """Agrega una línea al journal con el mismo flock que protege el snapshot."""
+    if fcntl is not None:
+        with open(journal_path.with_suffix(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _append_line_unlocked(journal_path, line)
+    else:
+        _append_line_unlocked(journal_path, line)
+
+
+def _append_line_unlocked(journal_path: Path, line: bytes) -> None:
+    fd = os.open(journal_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line)
+        _fdatasync(fd)
+    finally:
+        os.close(fd)
+
+
+def _compact_journal(path: Path, journal_path: Path, line: bytes, snapshot: bytes) -> None:
+    """Snapshot completo + journal en cero, como una sola sección bajo flock."""
+    if fcntl is not None:
+        with open(path.with_suffix(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _compact_journal_unlocked(path, journal_path, line, snapshot)
+    else:
+        _compact_journal_unlocked(path, journal_path, line, snapshot)
+
+
+def _compact_journal_unlocked(path: Path, journal_path: Path, line: bytes, snapshot: bytes) -> None:
+    # Orden a prueba de crash: como _read_disk le da precedencia al journal,
+    # primero el estado vigente entra al journal (durable), luego se reescribe
+    # el snapshot y al final se trunca (con fdatasync). Un crash en cualquier
+    # punto intermedio deja como última línea del journal el estado más nuevo,
+    # nunca resucita el anterior.
+    _append_line_unlocked(journal_path, line)
+    _write_bytes_atomic_unlocked(path, snapshot)
+    fd = os.open(journal_path, os.O_WRONLY)
+    try:
+        os.ftruncate(fd, 0)
+        _fdatasync(fd)
+    finally:
+        os.close(fd)
 
 
 class StateStore:
+    """Estado por club con caché en memoria.
+
+    Este proceso es el único escritor de state.json, así que después de la
+    primera lectura servimos siempre el dict cacheado y solo volvemos a tocar
+    disco si algún mtime cambió (p.ej. edición manual o escritura de otro worker).
+
+    Persistencia: cada save() agrega una línea al journal state.jsonl (el
+    estado completo, compacto); al recargar manda la última línea entera del
+    journal y state.json solo sirve de snapshot base. La compactación
+    periódica reescribe el snapshot y vacía el journal.
+
+    Los locks son por instancia (= por club): tráfico concurrente de clubes
+    distintos nunca se serializa entre sí, y tras la primera carga un load()
+    es solo lock + stat + retorno de la caché, sin parseo JSON dentro de la
+    sección crítica.
+    """
+
     def __init__(self, path: Path):
         self.path = path
+        self.journal_path = path.with_suffix(".jsonl")
         self._lock = Lock()
+        self._write_lock = Lock()
+        self._cache: Optional[dict] = None
+        self._mtimes: Tuple[float, float] = (0.0, 0.0)
+        self._seq = 0
+        self._written_seq = 0
+        self._journal_events = 0
+        # Último payload persistido/cargado: permite saltarse el fsync cuando
+        # un save() no cambió nada (p.ej. transacciones que resultan no-op).
+        self._last_payload: Optional[bytes] = None
+
+    def _disk_mtimes(self) -> Tuple[float, float]:
+        jm = self.journal_path.stat().st_mtime if self.journal_path.exists() else 0.0
+        return (self.path.stat().st_mtime, jm)
+
+    def _read_disk(self) -> dict:
+        # El journal manda: la última línea completa es el estado más nuevo.
+        if self.journal_path.exists():
+            for line in reversed(self.journal_path.read_bytes().splitlines()):
+                if not line.strip():
+                    continue
+                try:
+                    return _json_loads(line)
+                except ValueError:
+                    # Línea final cortada por un crash: prueba la anterior.
+                    continue
+        return _json_loads(self.path.read_bytes())
+
+    def _load_locked(self) -> dict:
+        if not self.path.exists():
+            st = {
+                "round": 0,
+                "pending": {},
+                "pending_by_candidate": {},
+                "accepted": {},
+                "accepted_waids": set(),
+                "members_cycle": {},
+                "last_summary": None,
+                "canceled": False,
+            }
+            self._cache = st
+            _write_bytes_atomic(self.path, _encode_state(st))
+            self._mtimes = self._disk_mtimes()
+            self._last_payload = _encode_state_line(st)
+            return st
+        mtimes = self._disk_mtimes()
+        if self._cache is None or mtimes != self._mtimes:
+            st = self._read_disk()
+            st["members_cycle"] = {w: set(v) for w, v in st.get("members_cycle", {}).items()}
+            # Estados previos a los sets incrementales los derivan una sola vez aquí.
+            st["accepted_waids"] = set(
+                st.get("accepted_waids") or (a["waid"] for a in st.get("accepted", {}).values())
+            )
+            st["pending_by_candidate"] = st.get("pending_by_candidate") or {
+                i["candidate"]: r
+                for r, i in st.get("pending", {}).items()
+                if i.get("candidate")
+            }
+            st.pop("pending_waids", None)  # campo de una versión anterior
+            self._cache = st
+            self._mtimes = mtimes
+            self._last_payload = _encode_state_line(st)
+        return self._cache
+
+    def _stage_locked(self, st: dict) -> Optional[Tuple[int, bytes]]:
+        """Actualiza la caché y serializa bajo _lock; la escritura va aparte.
+
+        Devuelve None si el estado serializado es idéntico al último escrito:
+        no hay nada que persistir.
+        """
+        self._cache = st
+        payload = _encode_state_line(st)
+        if payload == self._last_payload:
+            return None
+        self._last_payload = payload
+        self._seq += 1
+        return self._seq, payload
+
+    def _flush(self, seq: int, payload: bytes) -> None:
+        # El fsync (milisegundos) corre bajo _write_lock para no frenar a los
+        # lectores, que solo necesitan _lock. Si otro hilo ya escribió un
+        # estado más nuevo, este payload quedó obsoleto y se descarta.
+        with self._write_lock:
+            if seq < self._written_seq:
+                return
+            self._journal_events += 1
+            if self._journal_events >= _JOURNAL_COMPACT_EVERY:
+                snap = payload if _STATE_JSON_INDENT is None else _encode_state(_json_loads(payload))
+                _compact_journal(self.path, self.journal_path, payload + b"\n", snap)
+                self._journal_events = 0
+            else:
+                _append_line_durable(self.journal_path, payload + b"\n")
+            self._written_seq = seq
+            with self._lock:
+                self._mtimes = self._disk_mtimes()
 
     def load(self) -> dict:
         with self._lock:
-            if not self.path.exists():
-                st = {
-                    "round": 0,
-                    "pending": {},
-                    "accepted": {},
-                    "members_cycle": {},
-                    "last_summary": None,
-                    "canceled": False,
-                }
-                _dump_json_atomic(self.path, st)
-                return st
-            return json.loads(self.path.read_text(encoding="utf-8"))
+            return self._load_locked()
 
     def save(self, st: dict) -> None:
         with self._lock:
-            _dump_json_atomic(self.path, st)
+            staged = self._stage_locked(st)
+        if staged:
+            self._flush(*staged)
+
+    @contextmanager
+    def transaction(self):
+        """Carga una vez, entrega el dict mutable y persiste una sola vez al salir.
+
+        Si el cuerpo del `with` lanza una excepción no se escribe nada a disco
+        y la caché se invalida: el cuerpo muta el dict cacheado en el lugar,
+        así que el próximo load() relee el último estado persistido en vez de
+        servir la mutación a medias.
+        Solo para rutas que van a mutar el estado; las de solo lectura usan load().
+        """
+        with self._lock:
+            st = self._load_locked()
+            try:
+                yield st
+            except BaseException:
+                self._cache = None
+                raise
+            staged = self._stage_locked(st)
+        if staged:
+            self._flush(*staged)
+
+
+@functools.lru_cache(maxsize=1024)
+def norm(s: str) -> str:
+    # Fast-path: los comandos habituales ("1", "acepto", ...) son ASCII puro
+    # y no necesitan pasar por la normalización Unicode.
+    if s.isascii():
+        return s.strip().lower()
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    return s.strip().lower()
 
 
 _CTX: Dict[str, Ctx] = {}
 
 
+def _member_levels(c: Club) -> Tuple[Tuple[str, int], ...]:
+    return tuple((m.waid, int(getattr(m, "level", 1) or 1)) for m in c.members)
+
+
 def load_club_into_registry(club_id: str, meta: dict):
     club_dir = CFG.clubs_dir / club_id
     club_file = club_dir / "club.json"
@@ -166,18 +447,13 @@ def load_club_into_registry(club_id: str, meta: dict):
     c.load_from_json(str(club_file))
     st = StateStore(state_file)
 
-    s = st.load()
-    mc = s.get("members_cycle", {})
-    changed = False
-    for m in c.members:
-        if m.waid not in mc:
-            mc[m.waid] = []
-            changed = True
-    if changed:
-        s["members_cycle"] = mc
-    st.save(s)
-
-    admins = set(meta.get("admins", []))
+    with st.transaction() as s:
+        mc = s.setdefault("members_cycle", {})
+        for m in c.members:
+            if m.waid not in mc:
+                mc[m.waid] = set()
+
+    admins = frozenset(meta.get("admins", []))
     ctx = Ctx(
         club_id=club_id,
         club=c,
@@ -186,27 +462,52 @@ def load_club_into_registry(club_id: str, meta: dict):
         admins=admins,
         all_numbers=tuple(m.waid for m in c.members),
         members_index={m.waid for m in c.members},
+        name_by_waid={m.waid: m.name for m in c.members},
+        members_by_waid={m.waid: m for m in c.members},
+        members_by_norm_name={norm(m.name): m for m in c.members},
+        member_levels=_member_levels(c),
+        roles_by_name={r.name: r for r in c.roles},
+        role_names=tuple(r.name for r in c.roles),
+        role_names_set=frozenset(r.name for r in c.roles),
     )
     _CTX[club_id] = ctx
     log.info("Cargado club %s (miembros=%d, admins=%d)", club_id, len(ctx.members_index), len(ctx.admins))
 
 
+# Índices inversos waid -> [club_id]: cada webhook resuelve el club con un
+# lookup O(1) en vez de recorrer todos los clubes. Se reconstruyen en
+# load_all_clubs y se mantienen al agregar/eliminar miembros.
+_ADMIN_TO_CLUBS: Dict[str, List[str]] = {}
+_MEMBER_TO_CLUBS: Dict[str, List[str]] = {}
+
+
+def _rebuild_reverse_indexes() -> None:
+    _ADMIN_TO_CLUBS.clear()
+    _MEMBER_TO_CLUBS.clear()
+    for cid, ctx in _CTX.items():
+        for w in ctx.admins:
+            _ADMIN_TO_CLUBS.setdefault(w, []).append(cid)
+        for w in ctx.members_index:
+            _MEMBER_TO_CLUBS.setdefault(w, []).append(cid)
+
+
 def load_all_clubs():
     reg = load_registry()
     _CTX.clear()
     for cid, meta in reg.get("clubs", {}).items():
         load_club_into_registry(cid, meta)
+    _rebuild_reverse_indexes()
 
 
 load_all_clubs()
 
 
 def admin_clubs(waid: str) -> List[str]:
-    return [cid for cid, ctx in _CTX.items() if waid in ctx.admins]
+    return _ADMIN_TO_CLUBS.get(waid, [])
 
 
 def member_clubs(waid: str) -> List[str]:
-    return [cid for cid, ctx in _CTX.items() if waid in ctx.members_index]
+    return _MEMBER_TO_CLUBS.get(waid, [])
 
 
 def member_club(waid: str) -> Optional[str]:
@@ -217,20 +518,45 @@ def member_club(waid: str) -> Optional[str]:
 # 3) Utilidades
 # ======================================================================================
 
-def norm(s: str) -> str:
-    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
-    return s.strip().lower()
+_EMPTY_SET: frozenset = frozenset()
 
 
+# norm() vive arriba, junto a la carga de clubes, porque los índices de Ctx
+# se construyen con él en tiempo de import.
+
+# Vocabulario de comandos legacy, ya normalizado (ver PRIORIDAD 4 del webhook).
+WHOAMI_CMDS = frozenset({"mi rol", "mi rol?", "whoami"})
+ACCEPT_CMDS = frozenset({"acepto", "accept"})
+REJECT_CMDS = frozenset({"rechazo", "reject"})
+
+
+# Saneo de números: un solo sub() en C en vez de recorrer carácter por carácter.
+_NON_DIGIT_RE = re.compile(r"\D+")
+
+# Opciones numéricas de menú (1-999); compilado una vez para el camino caliente.
+_MENU_NUMBER_RE = re.compile(r"\d{1,3}")
+
+# "Nombre, 55XXXXXXXX" o "Nombre 55XXXXXXXX": captura nombre y número en una
+# pasada y valida la forma del teléfono antes de llegar a admin_add_member.
+_ADD_MEMBER_RE = re.compile(r"^(?P<name>.+?)\s*[,\s]\s*(?P<num>\+?\d[\d\s\-]{8,14}\d)\s*$")
+
+
+def _digits(s: str) -> str:
+    return _NON_DIGIT_RE.sub("", s)
+
+
+@functools.lru_cache(maxsize=2048)
 def mx_public_from_internal(waid: str) -> str:
-    digits = "".join(ch for ch in waid if ch.isdigit())
+    # Los waids son pocos y estables; memoizar evita re-filtrar dígitos en
+    # cada listado/resumen.
+    digits = _digits(waid)
     if digits.startswith("521") and len(digits) >= 13:
         return digits[-10:]
     return digits
 
 
 def mx_internal_from_any(s: str) -> str:
-    digits = "".join(ch for ch in s if ch.isdigit())
+    digits = _digits(s)
     if len(digits) == 10:
         return "521" + digits
     if digits.startswith("521") and len(digits) >= 13:
@@ -238,28 +564,41 @@ def mx_internal_from_any(s: str) -> str:
     return digits
 
 
-def pending_candidates(st: dict, exclude_role: Optional[str] = None) -> Set[str]:
-    cands: Set[str] = set()
-    for r, info in st.get("pending", {}).items():
-        if exclude_role is not None and r == exclude_role:
-            continue
-        cand = info.get("candidate")
-        if cand:
-            cands.add(cand)
-    return cands
+# Sesión HTTP compartida: keep-alive + pool de conexiones evita un handshake
+# TLS por mensaje. requests.Session es thread-safe para estos POST simples.
+# allowed_methods debe incluir POST explícitamente (el default de Retry lo
+# excluye); con 429 en la lista los reintentos respetan el Retry-After de
+# Gupshup, y el tope de workers del pool de envíos acota la tasa de salida.
+HTTP = requests.Session()
+HTTP.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset({"POST"}),
+        ),
+    ),
+)
 
 
-def send_text(to_e164_no_plus: str, text: str) -> dict:
-    url = "https://api.gupshup.io/wa/api/v1/msg"
-    data = {
-        "channel": "whatsapp",
-        "source": CFG.source,
-        "destination": to_e164_no_plus,
-        "message": text,
-        "src.name": CFG.app_name,
-    }
+# Campos constantes del payload de Gupshup, armados una vez; por mensaje solo
+# cambian destination/message.
+_GUPSHUP_MSG_URL = "https://api.gupshup.io/wa/api/v1/msg"
+_BASE_PAYLOAD = {
+    "channel": "whatsapp",
+    "source": CFG.source,
+    "src.name": CFG.app_name,
+}
+
+
+def _send_text_now(to_e164_no_plus: str, text: str) -> dict:
+    data = {**_BASE_PAYLOAD, "destination": to_e164_no_plus, "message": text}
     try:
-        r = requests.post(url, headers=HEADERS_FORM, data=data, timeout=15)
+        r = HTTP.post(_GUPSHUP_MSG_URL, headers=HEADERS_FORM, data=data, timeout=15)
         if r.ok:
             return r.json()
         log.warning("Gupshup %s: %s", r.status_code, r.text)
@@ -269,64 +608,149 @@ def send_text(to_e164_no_plus: str, text: str) -> dict:
         return {"ok": False, "error": str(e)}
 
 
+# Pool de salida hacia Gupshup: los handlers encolan y responden de inmediato;
+# los workers hacen el POST y el tope de workers acota la tasa de envío. Ojo:
+# el executor solo garantiza el orden de arranque, no el de terminación, así
+# que los envíos al mismo destinatario se encadenan aparte (ver _SEND_CHAIN).
+_BROADCAST_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BROADCAST_CONCURRENCY", "16")),
+    thread_name_prefix="broadcast",
+)
+
+# Último envío en vuelo por destinatario: cada send_text espera al anterior del
+# mismo waid antes de hacer su POST, para que "resultado" y "menú" lleguen en
+# el orden en que se encolaron; destinatarios distintos siguen en paralelo.
+# No hay deadlock: cada tarea solo espera a una encolada antes que ella.
+_SEND_CHAIN: Dict[str, Future] = {}
+_SEND_CHAIN_LOCK = Lock()
+
+# Guardados de club.json fuera del camino del mensaje: un único worker
+# serializa las escrituras y el flag por club coalesce ráfagas de accepts
+# (siempre se vuelca la versión vigente del objeto, no cada intermedia).
+_CLUB_SAVER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="club-save")
+
+
+def _save_club_async(ctx: Ctx) -> None:
+    if ctx.club_save_pending:
+        return
+    ctx.club_save_pending = True
+
+    def _run() -> None:
+        ctx.club_save_pending = False
+        ctx.club.save_to_json(str(ctx.club_file))
+
+    _CLUB_SAVER.submit(_run)
+
+
+def send_text(to_e164_no_plus: str, text: str) -> dict:
+    """Encola el envío; el POST real corre en el pool para no bloquear el webhook."""
+    with _SEND_CHAIN_LOCK:
+        prev = _SEND_CHAIN.get(to_e164_no_plus)
+
+        def _in_order(prev: Optional[Future] = prev) -> dict:
+            if prev is not None:
+                try:
+                    prev.result()
+                except Exception:
+                    pass  # el envío anterior ya dejó su log
+            return _send_text_now(to_e164_no_plus, text)
+
+        _SEND_CHAIN[to_e164_no_plus] = _BROADCAST_POOL.submit(_in_order)
+    return {"ok": True, "queued": True}
+
+
 def broadcast_text(numbers: Set[str] | List[str] | Tuple[str, ...], text: str) -> Dict[str, int]:
-    ok = fail = 0
-    for n in numbers:
-        res = send_text(n, text)
-        if res.get("ok") is False or res.get("status_code", 200) >= 400:
-            fail += 1
-        else:
-            ok += 1
-    return {"ok": ok, "fail": fail}
+    queued = 0
+    # dict.fromkeys dedup preservando orden: nadie recibe el mismo texto dos veces.
+    for n in dict.fromkeys(numbers):
+        send_text(n, text)
+        queued += 1
+    return {"queued": queued}
 
 
 def pretty_name(ctx: Ctx, waid: str) -> str:
-    m = next((m for m in ctx.club.members if m.waid == waid), None)
-    return m.name if m else waid
+    return ctx.name_by_waid.get(waid, waid)
 
 
 def role_min_level(ctx: Ctx, role_name: str) -> int:
-    r = next((r for r in ctx.club.roles if r.name == role_name), None)
+    r = ctx.roles_by_name.get(role_name)
     return max(1, int(getattr(r, "difficulty", 1) or 1)) if r else 1
 
 
-def choose_candidate_hier(ctx: Ctx, role: str, excluded: Set[str]) -> Optional[str]:
-    st = ctx.state_store.load()
-    min_lvl = role_min_level(ctx, role)
-
-    def lvl(m: Member) -> int:
-        return int(getattr(m, "level", 1) or 1)
+def choose_candidate_hier(ctx: Ctx, st: dict, role: str, excluded: Set[str]) -> Optional[str]:
+    """Elige candidato en UNA sola pasada sobre el padrón.
 
-    def pool(filter_fn, allow_repeat: bool) -> List[str]:
-        res = []
-        for m in ctx.club.members:
-            if m.waid in excluded:
-                continue
-            if not filter_fn(m):
-                continue
-            done = set(st["members_cycle"].get(m.waid, []))
-            if not allow_repeat and role in done:
-                continue
-            res.append(m.waid)
-        return res
+    Mantiene un reservorio k=1 por franja de prioridad (nivel suficiente sin
+    repetir, luego con repetición, luego cada nivel menor en descenso) y al
+    final devuelve el primero no vacío, en vez de re-escanear por franja.
+    """
+    min_lvl = role_min_level(ctx, role)
+    # Franjas: 0 = nivel>=min sin repetir, 1 = nivel>=min repitiendo;
+    # para cada nivel L < min: 2*(min-L) sin repetir y +1 repitiendo.
+    n_tiers = 2 * min_lvl
+    chosen: List[Optional[str]] = [None] * n_tiers
+    counts = [0] * n_tiers
+    members_cycle = st["members_cycle"]
+    for waid, lvl in ctx.member_levels:
+        if waid in excluded or lvl < 1:
+            continue
+        done = members_cycle.get(waid) or _EMPTY_SET
+        repeat = 1 if role in done else 0
+        tier = repeat if lvl >= min_lvl else 2 * (min_lvl - lvl) + repeat
+        counts[tier] += 1
+        if random.random() * counts[tier] < 1.0:
+            chosen[tier] = waid
+    for cand in chosen:
+        if cand:
+            return cand
+    return None
 
-    p = pool(lambda m: lvl(m) >= min_lvl, allow_repeat=False)
-    if p:
-        return random.choice(p)
 
-    p = pool(lambda m: lvl(m) >= min_lvl, allow_repeat=True)
-    if p:
-        return random.choice(p)
+def _role_queue(ctx: Ctx, st: dict, role: str) -> List[str]:
+    """Cola de candidatos para un rol, ya ordenada por prioridad.
 
+    Reproduce el orden de choose_candidate_hier (nivel suficiente sin repetir,
+    luego con repetición, luego niveles menores en descenso), barajando dentro
+    de cada franja. Se calcula una sola vez al inicio de la ronda; los rechazos
+    solo sacan el siguiente de la cola en O(1) en vez de re-escanear el padrón.
+    """
+    min_lvl = role_min_level(ctx, role)
+    fresh_hi: List[str] = []
+    repeat_hi: List[str] = []
+    lower: Dict[int, Tuple[List[str], List[str]]] = {L: ([], []) for L in range(1, min_lvl)}
+    for waid, lvl in ctx.member_levels:
+        done = st["members_cycle"].get(waid) or _EMPTY_SET
+        fresh = role not in done
+        if lvl >= min_lvl:
+            (fresh_hi if fresh else repeat_hi).append(waid)
+        elif lvl in lower:
+            lower[lvl][0 if fresh else 1].append(waid)
+
+    tiers = [fresh_hi, repeat_hi]
     for L in range(min_lvl - 1, 0, -1):
-        p = pool(lambda m, L=L: lvl(m) == L, allow_repeat=False)
-        if p:
-            return random.choice(p)
-        p = pool(lambda m, L=L: lvl(m) == L, allow_repeat=True)
-        if p:
-            return random.choice(p)
-
-    return None
+        tiers.append(lower[L][0])
+        tiers.append(lower[L][1])
+
+    queue: List[str] = []
+    for tier in tiers:
+        random.shuffle(tier)
+        queue.extend(tier)
+    return queue
+
+
+def next_candidate(ctx: Ctx, st: dict, role: str, excluded: Set[str]) -> Optional[str]:
+    """Siguiente candidato para el rol: toma de la cola precalculada si existe
+    (estado nuevo) y cae a choose_candidate_hier para estados viejos o colas
+    agotadas (p.ej. miembros agregados a media ronda)."""
+    queue = st.get("eligible_by_role", {}).get(role)
+    if queue:
+        for i, w in enumerate(queue):
+            # La cola se calculó al inicio de la ronda: puede traer miembros
+            # eliminados a media ronda, que ya no son invitables.
+            if w not in excluded and w in ctx.members_index:
+                del queue[i]
+                return w
+    return choose_candidate_hier(ctx, st, role, excluded)
 
 # --- Admin helpers --------------------------------------------------------------------
 
@@ -334,16 +758,15 @@ def admin_list_members(ctx: Ctx) -> str:
     if not ctx.club.members:
         return f"No hay miembros registrados aún en {ctx.club_id}."
     lines = [f"👥 Miembros de {ctx.club_id}"]
-    for m in ctx.club.members:
-        pub = mx_public_from_internal(m.waid)
-        lines.append(f"- {m.name} — {pub}  · nivel {getattr(m, 'level', 1)}")
+    lines.extend(
+        f"- {m.name} — {mx_public_from_internal(m.waid)}  · nivel {m.level}"
+        for m in ctx.club.members
+    )
     admin_labels = []
     for a in ctx.admins:
-        member = next((m for m in ctx.club.members if m.waid == a), None)
-        if member:
-            admin_labels.append(f"{member.name} ({mx_public_from_internal(a)})")
-        else:
-            admin_labels.append(mx_public_from_internal(a))
+        member = ctx.members_by_waid.get(a)
+        pub = mx_public_from_internal(a)
+        admin_labels.append(f"{member.name} ({pub})" if member else pub)
     if admin_labels:
         lines.append("")
         lines.append("🔑 Administradores: " + ", ".join(admin_labels))
@@ -352,14 +775,14 @@ def admin_list_members(ctx: Ctx) -> str:
 
 def _find_member_by_waid_or_name(ctx: Ctx, token: str):
     t_clean = token.strip()
-    digits = "".join(ch for ch in t_clean if ch.isdigit())
+    digits = _digits(t_clean)
     if digits:
         target = mx_internal_from_any(digits)
-        m = next((m for m in ctx.club.members if m.waid == target), None)
+        m = ctx.members_by_waid.get(target)
         if m:
             return m
-    t_norm = norm(t_clean)
-    return next((m for m in ctx.club.members if norm(m.name) == t_norm), None)
+    # Dos sondeos de hash en vez de re-normalizar cada nombre del padrón.
+    return ctx.members_by_norm_name.get(norm(t_clean))
 
 
 def admin_add_member(ctx: Ctx, name: str, raw_number: str, level: int = 1, is_guest: bool = False) -> str:
@@ -367,20 +790,26 @@ def admin_add_member(ctx: Ctx, name: str, raw_number: str, level: int = 1, is_gu
     waid = mx_internal_from_any(raw_number)
     if not name or not waid:
         return "Formato no válido. Usa: Nombre, 55XXXXXXXX"
-    if any(m.waid == waid for m in ctx.club.members):
+    if waid in ctx.members_index:
         return "Ese número ya está registrado en el club."
 
     new_m = Member(name=name, waid=waid, is_guest=is_guest, level=level)
     ctx.club.members.append(new_m)
 
-    st = ctx.state_store.load()
-    st.setdefault("members_cycle", {})[waid] = []
-    ctx.state_store.save(st)
+    with ctx.state_store.transaction() as st:
+        st.setdefault("members_cycle", {})[waid] = set()
 
     ctx.club.save_to_json(str(ctx.club_file))
 
     ctx.members_index.add(waid)
+    ctx.name_by_waid[waid] = name
+    ctx.members_by_waid[waid] = new_m
+    ctx.members_by_norm_name[norm(name)] = new_m
+    ctx.member_levels = _member_levels(ctx.club)
     ctx.all_numbers = tuple(m.waid for m in ctx.club.members)
+    clubs = _MEMBER_TO_CLUBS.setdefault(waid, [])
+    if ctx.club_id not in clubs:
+        clubs.append(ctx.club_id)
 
     return f"✅ Listo: {name} agregado a {ctx.club_id} (tel. {mx_public_from_internal(waid)}, nivel {level})."
 
@@ -399,11 +828,23 @@ def admin_remove_member(ctx: Ctx, waid_or_name: str) -> str:
     ctx.club.members = [m for m in ctx.club.members if m.waid != target.waid]
     ctx.club.save_to_json(str(ctx.club_file))
     st["members_cycle"].pop(target.waid, None)
+    for queue in st.get("eligible_by_role", {}).values():
+        if target.waid in queue:
+            queue.remove(target.waid)
     ctx.state_store.save(st)
 
     if target.waid in ctx.members_index:
         ctx.members_index.remove(target.waid)
+    ctx.name_by_waid.pop(target.waid, None)
+    ctx.members_by_waid.pop(target.waid, None)
+    ctx.members_by_norm_name.pop(norm(target.name), None)
+    ctx.member_levels = _member_levels(ctx.club)
     ctx.all_numbers = tuple(m.waid for m in ctx.club.members)
+    clubs = _MEMBER_TO_CLUBS.get(target.waid)
+    if clubs and ctx.club_id in clubs:
+        clubs.remove(ctx.club_id)
+        if not clubs:
+            del _MEMBER_TO_CLUBS[target.waid]
 
     return f"🗑️ Eliminado de {ctx.club_id}: {target.name} (tel. {mx_public_from_internal(target.waid)})."
 
@@ -412,35 +853,39 @@ def admin_remove_member(ctx: Ctx, waid_or_name: str) -> str:
 # ======================================================================================
 
 def start_new_round(ctx: Ctx, by_admin: str) -> str:
-    st = ctx.state_store.load()
-    if any(not v.get("accepted") for v in st["pending"].values()):
+    if any(not v.get("accepted") for v in ctx.state_store.load()["pending"].values()):
         return "Ya hay invitaciones pendientes. Primero cierra o cancela esa ronda."
 
-    st["round"] += 1
-    st["pending"] = {}
-    st["accepted"] = {}
-    st["last_summary"] = None
-    st["canceled"] = False
-
-    roles_sorted = sorted(ctx.club.roles, key=lambda r: int(getattr(r, "difficulty", 1) or 1), reverse=True)
-
-    for r in roles_sorted:
-        role = r.name
-        excluded = set(a["waid"] for a in st["accepted"].values())
-        excluded.update(pending_candidates(st))
-        cand = choose_candidate_hier(ctx, role, excluded)
-        if not cand:
-            continue
-        st["pending"][role] = {"candidate": cand, "declined_by": [], "accepted": False}
-
-    ctx.state_store.save(st)
+    with ctx.state_store.transaction() as st:
+        st["round"] += 1
+        st["pending"] = {}
+        st["pending_by_candidate"] = {}
+        st["accepted"] = {}
+        st["accepted_waids"] = set()
+        st["last_summary"] = None
+        st["canceled"] = False
+
+        roles_sorted = sorted(ctx.club.roles, key=lambda r: int(getattr(r, "difficulty", 1) or 1), reverse=True)
+        st["eligible_by_role"] = {r.name: _role_queue(ctx, st, r.name) for r in roles_sorted}
+
+        # accepted/pending recién se reiniciaron arriba: el excluido arranca
+        # vacío y solo crece con los candidatos que vamos asignando.
+        excluded: Set[str] = set()
+        for r in roles_sorted:
+            role = r.name
+            cand = next_candidate(ctx, st, role, excluded)
+            if not cand:
+                continue
+            st["pending"][role] = {"candidate": cand, "declined_by": [], "accepted": False}
+            st["pending_by_candidate"][cand] = role
+            excluded.add(cand)
 
     for role, info in st["pending"].items():
         cand = info["candidate"]
         begin_invite_flow(ctx, cand, role, st["round"])
 
     assigned_roles = set(st["pending"].keys())
-    not_assigned = [r.name for r in ctx.club.roles if r.name not in assigned_roles]
+    not_assigned = [r for r in ctx.role_names if r not in assigned_roles]
     if not_assigned:
         broadcast_text(
             ctx.admins,
@@ -453,56 +898,86 @@ def start_new_round(ctx: Ctx, by_admin: str) -> str:
 
 
 def handle_accept(ctx: Ctx, waid: str) -> str:
-    st = ctx.state_store.load()
-    for role, info in st["pending"].items():
-        if info["candidate"] == waid and not info["accepted"]:
-            info["accepted"] = True
-            st["accepted"][role] = {"waid": waid, "name": pretty_name(ctx, waid)}
-
-            done_list = list(st["members_cycle"].get(waid, []))
-            if role not in done_list:
-                done_list.append(role)
-            if len(done_list) >= len(ctx.club.roles):
-                done_list = []
-            st["members_cycle"][waid] = done_list
-
-            member = next((m for m in ctx.club.members if m.waid == waid), None)
-            role_obj = next((r for r in ctx.club.roles if r.name == role), None)
-            if member and role_obj:
-                member.add_role(role_obj)
-                ctx.club.save_to_json(str(ctx.club_file))
-
-            ctx.state_store.save(st)
-            check_and_announce_if_complete(ctx)
-            return f"✅ Aceptado: {role} por {pretty_name(ctx, waid)}."
+    with ctx.state_store.transaction() as st:
+        for role, info in st["pending"].items():
+            if info["candidate"] == waid and not info["accepted"]:
+                info["accepted"] = True
+                st["accepted"][role] = {"waid": waid, "name": pretty_name(ctx, waid)}
+                st["accepted_waids"].add(waid)
+
+                done = st["members_cycle"].setdefault(waid, set())
+                done.add(role)
+                if len(done) >= len(ctx.role_names):
+                    done.clear()
+
+                member = ctx.members_by_waid.get(waid)
+                role_obj = ctx.roles_by_name.get(role)
+                if member and role_obj:
+                    member.add_role(role_obj)  # puede subir el nivel
+                    ctx.member_levels = _member_levels(ctx.club)
+                    _save_club_async(ctx)
+
+                check_and_announce_if_complete(ctx, st)
+                return f"✅ Aceptado: {role} por {pretty_name(ctx, waid)}."
     return "No hay nada pendiente para aceptar."
 
 
 def handle_reject(ctx: Ctx, waid: str) -> str:
-    st = ctx.state_store.load()
-    for role, info in list(st["pending"].items()):
-        if info.get("candidate") == waid and not info.get("accepted"):
+    new_cand: Optional[str] = None
+    dropped_role: Optional[str] = None
+    result: Optional[str] = None
+    with ctx.state_store.transaction() as st:
+        # El índice candidato->rol evita recorrer st['pending'] dos veces.
+        by_cand = st["pending_by_candidate"]
+        role = by_cand.get(waid)
+        info = st["pending"].get(role) if role else None
+        if info and info.get("candidate") == waid and not info.get("accepted"):
             info["declined_by"].append(waid)
 
             excluded = set(info["declined_by"])
-            excluded.update(a["waid"] for a in st.get("accepted", {}).values())
-            excluded.update(pending_candidates(st, exclude_role=role))
+            excluded.update(st["accepted_waids"])
+            excluded.update(set(by_cand) - {waid})
 
-            cand = choose_candidate_hier(ctx, role, excluded)
+            cand = next_candidate(ctx, st, role, excluded)
             if cand:
                 info["candidate"] = cand
-                ctx.state_store.save(st)
-                begin_invite_flow(ctx, cand, role, st["round"])
-                return f"↪️ Rechazado por {pretty_name(ctx, waid)}. Nuevo candidato: {pretty_name(ctx, cand)}."
+                del by_cand[waid]
+                by_cand[cand] = role
+                new_cand = cand
+                result = f"↪️ Rechazado por {pretty_name(ctx, waid)}. Nuevo candidato: {pretty_name(ctx, cand)}."
             else:
                 del st["pending"][role]
-                ctx.state_store.save(st)
-                broadcast_text(ctx.admins, f"[{ctx.club_id}] No hay más opciones para el rol: {role}.")
-                return "Sin candidatos."
-    return "No hay nada pendiente para rechazar."
+                del by_cand[waid]
+                dropped_role = role
+                result = "Sin candidatos."
+
+    if new_cand:
+        begin_invite_flow(ctx, new_cand, role, st["round"])
+    elif dropped_role:
+        broadcast_text(ctx.admins, f"[{ctx.club_id}] No hay más opciones para el rol: {dropped_role}.")
+    return result if result is not None else "No hay nada pendiente para rechazar."
+
+
+def _summary_key(st: dict) -> tuple:
+    """Huella barata de todo lo que entra al resumen."""
+    wod = st.get("word_of_the_day") or {}
+    theme = st.get("session_theme") or {}
+    return (
+        st["round"],
+        tuple(sorted((r, a["name"]) for r, a in st["accepted"].items())),
+        wod.get("palabra"), wod.get("nombre"), wod.get("waid"),
+        theme.get("topic"), theme.get("nombre"), theme.get("waid"),
+    )
 
 
 def make_summary(ctx: Ctx, st: dict) -> str:
+    # El resumen es determinista en (round, accepted, palabra, temática);
+    # status_text y el chequeo de completitud lo piden varias veces seguidas
+    # con el mismo estado, así que se memoiza la última versión por club.
+    key = _summary_key(st)
+    cached = ctx.summary_cache
+    if cached is not None and cached[0] == key:
+        return cached[1]
     lines = [f"📋 Reunión #{st['round']} — Resumen de roles"]
     wod = st.get("word_of_the_day")
     if wod:
@@ -512,25 +987,28 @@ def make_summary(ctx: Ctx, st: dict) -> str:
     if theme:
         theme_nombre = theme.get("nombre") or (theme.get("waid") and pretty_name(ctx, theme["waid"])) or "Desconocido"
         lines.append(f"📝 Temática de la sesión: {theme.get('topic', '(sin temática)')} — {theme_nombre}.")
-    for role in [r.name for r in ctx.club.roles]:
-        if role in st["accepted"]:
-            w = st["accepted"][role]["waid"]
-            lines.append(f"- {role}: {pretty_name(ctx, w)}")
-        else:
-            lines.append(f"- {role}: por confirmar")
-    return "\n".join(lines)
-
-
-def check_and_announce_if_complete(ctx: Ctx) -> None:
-    st = ctx.state_store.load()
-    all_ok = all(role in st["accepted"] for role in [r.name for r in ctx.club.roles])
-    if not all_ok or st.get("canceled"):
+    acc = st["accepted"]
+    for role in ctx.role_names:
+        a = acc.get(role)
+        # El nombre ya quedó resuelto al aceptar; no hace falta pretty_name aquí.
+        lines.append(f"- {role}: {a['name']}" if a else f"- {role}: por confirmar")
+    text = "\n".join(lines)
+    ctx.summary_cache = (key, text)
+    return text
+
+
+def check_and_announce_if_complete(ctx: Ctx, st: dict) -> None:
+    """Anuncia la ronda completa. Muta st; el llamador persiste (transacción)."""
+    # Corte barato para el caso común "todavía faltan roles": comparar
+    # longitudes antes de armar strings o iterar.
+    if len(st["accepted"]) < len(ctx.role_names) or st.get("canceled"):
+        return
+    if not ctx.role_names_set.issubset(st["accepted"]):
         return
     summary = make_summary(ctx, st)
     if st.get("last_summary") == summary:
         return
     st["last_summary"] = summary
-    ctx.state_store.save(st)
     broadcast_text(ctx.all_numbers, f"[{ctx.club_id}] {summary}")
 
 
@@ -583,12 +1061,13 @@ def status_text(ctx: Ctx) -> str:
 
 
 def cancel_round(ctx: Ctx, by_admin: str) -> str:
-    st = ctx.state_store.load()
-    st["pending"] = {}
-    st["accepted"] = {}
-    st["last_summary"] = None
-    st["canceled"] = True
-    ctx.state_store.save(st)
+    with ctx.state_store.transaction() as st:
+        st["pending"] = {}
+        st["pending_by_candidate"] = {}
+        st["accepted"] = {}
+        st["accepted_waids"] = set()
+        st["last_summary"] = None
+        st["canceled"] = True
     broadcast_text(ctx.all_numbers, f"[{ctx.club_id}] 🛑 La ronda se canceló.")
     return f"La ronda #{st['round']} fue cancelada."
 
@@ -597,8 +1076,10 @@ def reset_all(ctx: Ctx, by_admin: str) -> str:
     st = {
         "round": 0,
         "pending": {},
+        "pending_by_candidate": {},
         "accepted": {},
-        "members_cycle": {m.waid: [] for m in ctx.club.members},
+        "accepted_waids": set(),
+        "members_cycle": {m.waid: set() for m in ctx.club.members},
         "last_summary": None,
         "canceled": False,
     }
@@ -644,9 +1125,10 @@ def set_session(waid: str, **kwargs) -> None:
         s.update(kwargs)
         save_session(waid, s)
 
-def render_root_menu(waid: str) -> str:
-    mclubs = member_clubs(waid)
-    aclubs = admin_clubs(waid)
+# El texto del menú raíz solo depende de los clubes del waid, no del waid en
+# sí: memoizamos por esa clave para no reconstruir el string en cada "volver".
+@functools.lru_cache(maxsize=256)
+def _root_menu_text(mclubs: Tuple[str, ...], aclubs: Tuple[str, ...]) -> str:
     opts = []
     idx = 1
     header = "🔢 Elige una opción y envía solo el número:"
@@ -664,15 +1146,22 @@ def render_root_menu(waid: str) -> str:
     opts.append(f"{idx}) 📌 Mi estado de rol"); idx += 1
     return header + "\n" + "\n".join(opts)
 
-def render_member_menu(ctx: Ctx) -> str:
+def render_root_menu(waid: str) -> str:
+    return _root_menu_text(tuple(member_clubs(waid)), tuple(admin_clubs(waid)))
+
+@functools.lru_cache(maxsize=None)
+def _member_menu_text(club_id: str) -> str:
     return (
-        f"[{ctx.club_id}] 🧭 Menú miembro\n"
+        f"[{club_id}] 🧭 Menú miembro\n"
         "🔢 Elige una opción y envía solo el número:\n"
         "1) 🎯 Mi rol (pendiente/confirmado)\n"
         "2) 📊 Estado de la ronda\n"
         "9) 🔙 Volver"
     )
 
+def render_member_menu(ctx: Ctx) -> str:
+    return _member_menu_text(ctx.club_id)
+
 def render_member_club_picker(mclubs: List[str]) -> str:
     lines = ["👤 Elige club para tu menú de miembro (envía solo el número):"]
     for i, cid in enumerate(mclubs, 1):
@@ -687,9 +1176,10 @@ def render_admin_club_picker(aclubs: List[str]) -> str:
     lines.append("9) 🔙 Volver")
     return "\n".join(lines)
 
-def render_admin_menu(ctx: Ctx) -> str:
+@functools.lru_cache(maxsize=None)
+def _admin_menu_text(club_id: str) -> str:
     return (
-        f"[{ctx.club_id}] 🛡️ Menú admin\n"
+        f"[{club_id}] 🛡️ Menú admin\n"
         "🔢 Elige una opción y envía solo el número:\n"
         "1) ▶️ Iniciar ronda\n"
         "2) 📊 Ver estado\n"
@@ -702,13 +1192,60 @@ def render_admin_menu(ctx: Ctx) -> str:
         "9) 🔙 Volver"
     )
 
+def render_admin_menu(ctx: Ctx) -> str:
+    return _admin_menu_text(ctx.club_id)
+
+# Plantillas compiladas una vez: solo cambian los campos, no el texto fijo.
+INVITE_TMPL = (
+    "🔔 Invitación: {role} en la reunión #{rnd} ({club}).\n"
+    "Elige una opción y envía solo el número:\n"
+    "1) ✅ Aceptar\n"
+    "2) ❌ Rechazar"
+)
+
+WORD_SUMMARY_TMPL = (
+    "📋 Resumen de Palabra del Día\n\n"
+    "📖 Palabra: {palabra}\n\n"
+    "✍️ Significado: {significado}\n\n"
+    "💡 Ejemplo: {ejemplo}\n\n"
+    "Elige:\n"
+    "1) 💾 Guardar\n"
+    "2) ✏️ Editar palabra\n"
+    "3) ✏️ Editar significado\n"
+    "4) ✏️ Editar ejemplo"
+)
+
+THEME_SUMMARY_TMPL = (
+    "📝 Temática de la sesión: {topic}\n\n"
+    "Elige:\n"
+    "1) 💾 Guardar\n"
+    "2) ✏️ Editar temática"
+)
+
+# Pasos de captura de los flujos awaiting (palabra del día / temática):
+# awaiting -> (campo del buffer, siguiente awaiting, respuesta(buffer)).
+# Un lookup por mensaje en vez de la escalera de ifs; los estados de
+# confirmación e invitación siguen aparte porque ramifican por opción.
+_CAPTURE_STEPS: Dict[str, Tuple[str, str, "Callable[[dict], str]"]] = {
+    "word_step1_palabra": (
+        "palabra", "word_step2_significado",
+        lambda b: "✍️ Envía el significado de la palabra:",
+    ),
+    "word_step2_significado": (
+        "significado", "word_step3_ejemplo",
+        lambda b: "💡 Envía un ejemplo de uso de la palabra:",
+    ),
+    "word_step3_ejemplo": ("ejemplo", "word_confirm", WORD_SUMMARY_TMPL.format_map),
+    "word_edit_palabra": ("palabra", "word_confirm", WORD_SUMMARY_TMPL.format_map),
+    "word_edit_significado": ("significado", "word_confirm", WORD_SUMMARY_TMPL.format_map),
+    "word_edit_ejemplo": ("ejemplo", "word_confirm", WORD_SUMMARY_TMPL.format_map),
+    "theme_step1_topic": ("topic", "theme_confirm", THEME_SUMMARY_TMPL.format_map),
+    "theme_edit_topic": ("topic", "theme_confirm", THEME_SUMMARY_TMPL.format_map),
+}
+
+
 def invite_text(ctx: Ctx, role: str, round_no: int) -> str:
-    return (
-        f"🔔 Invitación: {role} en la reunión #{round_no} ({ctx.club_id}).\n"
-        "Elige una opción y envía solo el número:\n"
-        "1) ✅ Aceptar\n"
-        "2) ❌ Rechazar"
-    )
+    return INVITE_TMPL.format_map({"role": role, "rnd": round_no, "club": ctx.club_id})
 
 
 def begin_invite_flow(ctx: Ctx, waid: str, role: str, round_no: int) -> None:
@@ -734,7 +1271,7 @@ app = Flask(__name__)
 def health():
     info = {}
     for cid, ctx in _CTX.items():
-        info[cid] = {"members": len(ctx.members_index), "roles": [r.name for r in ctx.club.roles]}
+        info[cid] = {"members": len(ctx.members_index), "roles": list(ctx.role_names)}
     return {"ok": True, "app": CFG.app_name, "clubs": info}
 
 
@@ -746,9 +1283,23 @@ def webhook_get():
     return "OK", 200
 
 
+# Patrones del sufijo de club, compilados una vez: el de corchetes es fijo y
+# los de strip dependen del cid, así que se memoizan por club.
+_TRAILING_BRACKET_RE = re.compile(r"\[([^\]]+)\]\s*$")
+
+
+@functools.lru_cache(maxsize=64)
+def _strip_club_patterns(cid: str) -> Tuple["re.Pattern", "re.Pattern"]:
+    esc = re.escape(cid)
+    return (
+        re.compile(rf"\s*\[\s*{esc}\s*\]\s*$", re.IGNORECASE),
+        re.compile(rf"\s+{esc}\s*$", re.IGNORECASE),
+    )
+
+
 def extract_trailing_club_id(text: str) -> Optional[str]:
     t = text.strip()
-    m = re.search(r"\[([^\]]+)\]\s*$", t)
+    m = _TRAILING_BRACKET_RE.search(t)
     if m:
         last = m.group(1).strip()
         return last if last in _CTX else None
@@ -761,9 +1312,9 @@ def extract_trailing_club_id(text: str) -> Optional[str]:
 
 
 def strip_trailing_club(text: str, cid: str) -> str:
-    t = text.strip()
-    t = re.sub(rf"\s*\[\s*{re.escape(cid)}\s*\]\s*$", "", t, flags=re.IGNORECASE)
-    t = re.sub(rf"\s+{re.escape(cid)}\s*$", "", t, flags=re.IGNORECASE)
+    bracket_re, bare_re = _strip_club_patterns(cid)
+    t = bracket_re.sub("", text.strip())
+    t = bare_re.sub("", t)
     return t.strip()
 
 
@@ -775,15 +1326,13 @@ def infer_user_club(waid: str, explicit_cid: Optional[str] = None) -> Optional[s
         return mclubs[0]
     if len(mclubs) > 1:
         return None
+    # Fallback (waid fuera de todo padrón): los sets mantenidos por ronda
+    # reducen el barrido a dos membresías O(1) por club, sin recorrer dicts.
     candidates = []
     for cid, ctx in _CTX.items():
         st = ctx.state_store.load()
-        for info in st.get("pending", {}).values():
-            if info.get("candidate") == waid and not info.get("accepted"):
-                candidates.append(cid); break
-        for info in st.get("accepted", {}).values():
-            if info.get("waid") == waid:
-                candidates.append(cid); break
+        if waid in st["pending_by_candidate"] or waid in st["accepted_waids"]:
+            candidates.append(cid)
     if len(candidates) == 1:
         return candidates[0]
     return None
@@ -791,456 +1340,418 @@ def infer_user_club(waid: str, explicit_cid: Optional[str] = None) -> Optional[s
 
 def has_pending_invite(ctx: Ctx, waid: str) -> Optional[str]:
     st = ctx.state_store.load()
-    for role, info in st.get("pending", {}).items():
-        if info.get("candidate") == waid and not info.get("accepted"):
-            return role
+    role = st["pending_by_candidate"].get(waid)
+    info = st["pending"].get(role) if role else None
+    if info and info.get("candidate") == waid and not info.get("accepted"):
+        return role
     return None
 
 
-@app.route("/webhook", methods=["POST"])
-def webhook_post():
-    data = request.get_json(force=True, silent=True) or {}
-    try:
-        value = (
-            (data.get("entry") or [{}])[0]
-            .get("changes", [{}])[0]
-            .get("value", {})
-        )
-        for msg in value.get("messages", []):
-            if msg.get("type") != "text":
-                continue
-            waid = msg.get("from", "")
-            body_raw = msg.get("text", {}).get("body", "")
-            body = norm(body_raw)
-            log.info("Mensaje de %s: %s", waid, body)
-            s = get_session(waid)
-
-            # 0) Identificación inicial
-            is_number = re.fullmatch(r"\d{1,3}", body) is not None
-
-            if not s.get("club"):
-                mclubs = member_clubs(waid)
-                acls = admin_clubs(waid)
-                if len(mclubs) == 1:
-                    set_session(waid, club=mclubs[0])
-                elif len(acls) == 1:
-                    set_session(waid, club=acls[0])
-
-            current_cid = s.get("club") or infer_user_club(waid, extract_trailing_club_id(body_raw))
-            if current_cid and current_cid in _CTX:
-                ctx = _CTX[current_cid]
-            else:
-                ctx = None
-
-            # PRIORIDAD 2: Flujos awaiting (SIEMPRE antes de menús)
-            awaiting = s.get("awaiting")
-
-            # --- Flujo de invitación a rol (solo 1/2). Cualquier otra cosa re-muestra el prompt.
-            if awaiting == "invite_decision":
-                if body == "1":
-                    buffer = s.get("buffer", {})
-                    club_ctx = _CTX[buffer["club"]]
-                    role_name = buffer["role"]
-                    accept_msg = handle_accept(club_ctx, waid)
-                    send_text(waid, accept_msg)
-
-                    # Subflujos posteriores según rol (mantén exactamente los mismos emojis/estilo)
-                    role_norm = role_name.lower()
-                    st_now = club_ctx.state_store.load()
-                    if "evaluador gramatical" in role_norm:
-                        set_session(
-                            waid,
-                            awaiting="word_step1_palabra",
-                            buffer={"role": role_name, "waid": waid, "club": club_ctx.club_id, "round": st_now["round"]},
-                        )
-                        send_text(waid, "📖 Envía la palabra del día:")
-                    elif "toastmaster" in role_norm or "toastmasters de la noche" in role_norm:
-                        set_session(
-                            waid,
-                            awaiting="theme_step1_topic",
-                            buffer={"role": role_name, "waid": waid, "club": club_ctx.club_id, "round": st_now["round"]},
-                        )
-                        send_text(waid, "📝 Envía la temática de la sesión:")
-                    else:
-                        set_session(waid, awaiting=None, buffer=None, mode="root")
-                        send_text(waid, render_root_menu(waid))
-                    return jsonify({"status": "ok"})
-
-                elif body == "2":
-                    buffer = s.get("buffer", {})
-                    club_ctx = _CTX[buffer["club"]]
-                    reject_msg = handle_reject(club_ctx, waid)
-                    send_text(waid, reject_msg)
-                    set_session(waid, awaiting=None, buffer=None, mode="root")
-                    send_text(waid, render_root_menu(waid))
-                    return jsonify({"status": "ok"})
+# --- Acciones de menú: despacho por número en vez de escaleras if/elif ----------------
 
-                else:
-                    buffer = s.get("buffer", {})
-                    club_ctx = _CTX[buffer["club"]]
-                    send_text(waid, "❗Opción inválida. Responde 1 (Aceptar) o 2 (Rechazar).")
-                    send_text(waid, invite_text(club_ctx, buffer["role"], buffer["round"]))
-                    return jsonify({"status": "ok"})
-
-            # Agregar miembro
-            if awaiting == "admin_add_member" and s.get("mode") == "admin" and ctx:
-                tail = body_raw.strip()
-                if "," in tail:
-                    name, num = tail.split(",", 1)
-                else:
-                    parts = tail.rsplit(" ", 1)
-                    if len(parts) != 2:
-                        send_text(waid, "Formato no válido. Usa: Nombre, 55XXXXXXXX")
-                        continue
-                    name, num = parts[0], parts[1]
-                out = admin_add_member(ctx, name.strip(), num.strip())
-                send_text(waid, out)
-                set_session(waid, awaiting=None, buffer=None)
-                send_text(waid, render_admin_menu(ctx))
-                continue
+def _menu_back_to_root(ctx: Ctx, waid: str) -> None:
+    set_session(waid, mode="root", awaiting=None, buffer=None)
+    send_text(waid, render_root_menu(waid))
 
-            # Eliminar miembro
-            if awaiting == "admin_remove_member" and s.get("mode") == "admin" and ctx:
-                tail = body_raw.strip()
-                out = admin_remove_member(ctx, tail)
-                send_text(waid, out)
-                set_session(waid, awaiting=None, buffer=None)
-                send_text(waid, render_admin_menu(ctx))
-                continue
 
-            # ============ FLUJO: Palabra del Día ============
-            if awaiting == "word_step1_palabra":
-                buffer = s.get("buffer", {})
-                buffer["palabra"] = body_raw.strip()
-                set_session(waid, awaiting="word_step2_significado", buffer=buffer)
-                send_text(waid, "✍️ Envía el significado de la palabra:")
-                continue
+def _member_menu_my_role(ctx: Ctx, waid: str) -> None:
+    send_text(waid, who_am_i(ctx, waid))
+    send_text(waid, render_member_menu(ctx))
 
-            if awaiting == "word_step2_significado":
-                buffer = s.get("buffer", {})
-                buffer["significado"] = body_raw.strip()
-                set_session(waid, awaiting="word_step3_ejemplo", buffer=buffer)
-                send_text(waid, "💡 Envía un ejemplo de uso de la palabra:")
-                continue
 
-            if awaiting == "word_step3_ejemplo":
-                buffer = s.get("buffer", {})
-                buffer["ejemplo"] = body_raw.strip()
-                set_session(waid, awaiting="word_confirm", buffer=buffer)
-
-                resumen = (
-                    f"📋 Resumen de Palabra del Día\n\n"
-                    f"📖 Palabra: {buffer['palabra']}\n\n"
-                    f"✍️ Significado: {buffer['significado']}\n\n"
-                    f"💡 Ejemplo: {buffer['ejemplo']}\n\n"
-                    f"Elige:\n"
-                    f"1) 💾 Guardar\n"
-                    f"2) ✏️ Editar palabra\n"
-                    f"3) ✏️ Editar significado\n"
-                    f"4) ✏️ Editar ejemplo"
-                )
-                send_text(waid, resumen)
-                continue
+def _member_menu_status(ctx: Ctx, waid: str) -> None:
+    send_text(waid, status_text(ctx))
+    send_text(waid, render_member_menu(ctx))
 
-            if awaiting == "word_confirm" and is_number:
-                buffer = s.get("buffer", {})
-                if body == "1":
-                    club_ctx = _CTX[buffer["club"]]
-                    st = club_ctx.state_store.load()
-                    st["word_of_the_day"] = {
-                        "palabra": buffer["palabra"],
-                        "significado": buffer["significado"],
-                        "ejemplo": buffer["ejemplo"],
-                        "waid": buffer["waid"],
-                        "nombre": pretty_name(club_ctx, buffer["waid"]),
-                        "round": buffer["round"]
-                    }
-                    club_ctx.state_store.save(st)
-                    send_text(waid, f"✅ Palabra del día guardada: '{buffer['palabra']}'")
-                    set_session(waid, awaiting=None, buffer=None, mode="root")
-                    send_text(waid, render_root_menu(waid))
-                    continue
-                elif body == "2":
-                    set_session(waid, awaiting="word_edit_palabra", buffer=buffer)
-                    send_text(waid, f"📖 Palabra actual: {buffer['palabra']}\nEnvía la nueva palabra:")
-                    continue
-                elif body == "3":
-                    set_session(waid, awaiting="word_edit_significado", buffer=buffer)
-                    send_text(waid, f"✍️ Significado actual: {buffer['significado']}\nEnvía el nuevo significado:")
-                    continue
-                elif body == "4":
-                    set_session(waid, awaiting="word_edit_ejemplo", buffer=buffer)
-                    send_text(waid, f"💡 Ejemplo actual: {buffer['ejemplo']}\nEnvía el nuevo ejemplo:")
-                    continue
-                else:
-                    send_text(waid, "Opción inválida. Envía 1, 2, 3 o 4.")
-                    continue
 
-            if awaiting == "word_edit_palabra":
-                buffer = s.get("buffer", {})
-                buffer["palabra"] = body_raw.strip()
-                set_session(waid, awaiting="word_confirm", buffer=buffer)
-                resumen = (
-                    f"📋 Resumen de Palabra del Día\n\n"
-                    f"📖 Palabra: {buffer['palabra']}\n\n"
-                    f"✍️ Significado: {buffer['significado']}\n\n"
-                    f"💡 Ejemplo: {buffer['ejemplo']}\n\n"
-                    f"Elige:\n"
-                    f"1) 💾 Guardar\n"
-                    f"2) ✏️ Editar palabra\n"
-                    f"3) ✏️ Editar significado\n"
-                    f"4) ✏️ Editar ejemplo"
-                )
-                send_text(waid, resumen)
-                continue
+def _admin_menu_start(ctx: Ctx, waid: str) -> None:
+    send_text(waid, start_new_round(ctx, pretty_name(ctx, waid)))
+    # Evita colisión: si ahora el admin tiene invitación pendiente o está en un flujo,
+    # no spamees el menú.
+    if not has_pending_invite(ctx, waid) and get_session(waid).get("awaiting") is None:
+        send_text(waid, render_admin_menu(ctx))
 
-            if awaiting == "word_edit_significado":
-                buffer = s.get("buffer", {})
-                buffer["significado"] = body_raw.strip()
-                set_session(waid, awaiting="word_confirm", buffer=buffer)
-                resumen = (
-                    f"📋 Resumen de Palabra del Día\n\n"
-                    f"📖 Palabra: {buffer['palabra']}\n\n"
-                    f"✍️ Significado: {buffer['significado']}\n\n"
-                    f"💡 Ejemplo: {buffer['ejemplo']}\n\n"
-                    f"Elige:\n"
-                    f"1) 💾 Guardar\n"
-                    f"2) ✏️ Editar palabra\n"
-                    f"3) ✏️ Editar significado\n"
-                    f"4) ✏️ Editar ejemplo"
-                )
-                send_text(waid, resumen)
-                continue
 
-            if awaiting == "word_edit_ejemplo":
-                buffer = s.get("buffer", {})
-                buffer["ejemplo"] = body_raw.strip()
-                set_session(waid, awaiting="word_confirm", buffer=buffer)
-                resumen = (
-                    f"📋 Resumen de Palabra del Día\n\n"
-                    f"📖 Palabra: {buffer['palabra']}\n\n"
-                    f"✍️ Significado: {buffer['significado']}\n\n"
-                    f"💡 Ejemplo: {buffer['ejemplo']}\n\n"
-                    f"Elige:\n"
-                    f"1) 💾 Guardar\n"
-                    f"2) ✏️ Editar palabra\n"
-                    f"3) ✏️ Editar significado\n"
-                    f"4) ✏️ Editar ejemplo"
-                )
-                send_text(waid, resumen)
-                continue
+def _admin_menu_status(ctx: Ctx, waid: str) -> None:
+    send_text(waid, status_text(ctx))
+    send_text(waid, render_admin_menu(ctx))
 
-            # ============ FLUJO: Temática de la Sesión ============
-            if awaiting == "theme_step1_topic":
-                buffer = s.get("buffer", {})
-                buffer["topic"] = body_raw.strip()
-                set_session(waid, awaiting="theme_confirm", buffer=buffer)
-
-                resumen = (
-                    f"📝 Temática de la sesión: {buffer['topic']}\n\n"
-                    f"Elige:\n"
-                    f"1) 💾 Guardar\n"
-                    f"2) ✏️ Editar temática"
-                )
-                send_text(waid, resumen)
-                continue
 
-            if awaiting == "theme_confirm" and is_number:
-                buffer = s.get("buffer", {})
-                if body == "1":
-                    club_ctx = _CTX[buffer["club"]]
-                    st = club_ctx.state_store.load()
-                    st["session_theme"] = {
-                        "topic": buffer["topic"],
-                        "waid": buffer["waid"],
-                        "nombre": pretty_name(club_ctx, buffer["waid"]),
-                        "round": buffer["round"]
-                    }
-                    club_ctx.state_store.save(st)
-                    send_text(waid, f"✅ Temática guardada: '{buffer['topic']}'")
-                    set_session(waid, awaiting=None, buffer=None, mode="root")
-                    send_text(waid, render_root_menu(waid))
-                    continue
-                elif body == "2":
-                    set_session(waid, awaiting="theme_edit_topic", buffer=buffer)
-                    send_text(waid, f"📝 Temática actual: {buffer['topic']}\nEnvía la nueva temática:")
-                    continue
-                else:
-                    send_text(waid, "Opción inválida. Envía 1 o 2.")
-                    continue
+def _admin_menu_cancel(ctx: Ctx, waid: str) -> None:
+    send_text(waid, cancel_round(ctx, pretty_name(ctx, waid)))
+    send_text(waid, render_admin_menu(ctx))
+
 
-            if awaiting == "theme_edit_topic":
-                buffer = s.get("buffer", {})
-                buffer["topic"] = body_raw.strip()
-                set_session(waid, awaiting="theme_confirm", buffer=buffer)
-                resumen = (
-                    f"📝 Temática de la sesión: {buffer['topic']}\n\n"
-                    f"Elige:\n"
-                    f"1) 💾 Guardar\n"
-                    f"2) ✏️ Editar temática"
+def _admin_menu_reset(ctx: Ctx, waid: str) -> None:
+    send_text(waid, reset_all(ctx, pretty_name(ctx, waid)))
+    send_text(waid, render_admin_menu(ctx))
+
+
+def _admin_menu_list(ctx: Ctx, waid: str) -> None:
+    send_text(waid, admin_list_members(ctx))
+    send_text(waid, render_admin_menu(ctx))
+
+
+def _admin_menu_add(ctx: Ctx, waid: str) -> None:
+    set_session(waid, awaiting="admin_add_member", buffer=None)
+    send_text(waid, "✍️ Envía: Nombre, 55XXXXXXXX")
+
+
+def _admin_menu_remove(ctx: Ctx, waid: str) -> None:
+    set_session(waid, awaiting="admin_remove_member", buffer=None)
+    send_text(waid, "✍️ Envía el número de 10 dígitos o el nombre exacto a eliminar")
+
+
+def _admin_menu_switch_club(ctx: Ctx, waid: str) -> None:
+    aclubs = admin_clubs(waid)
+    if len(aclubs) > 1:
+        set_session(waid, mode="admin_pick", awaiting="pick_admin_club")
+        send_text(waid, render_admin_club_picker(aclubs))
+    else:
+        send_text(waid, render_admin_menu(ctx))
+
+
+MEMBER_MENU_DISPATCH = {
+    "1": _member_menu_my_role,
+    "2": _member_menu_status,
+    "9": _menu_back_to_root,
+}
+
+ADMIN_MENU_DISPATCH = {
+    "1": _admin_menu_start,
+    "2": _admin_menu_status,
+    "3": _admin_menu_cancel,
+    "4": _admin_menu_reset,
+    "5": _admin_menu_list,
+    "6": _admin_menu_add,
+    "7": _admin_menu_remove,
+    "8": _admin_menu_switch_club,
+    "9": _menu_back_to_root,
+}
+
+
+# Cola de trabajo de entrada: el webhook solo valida y encola; un worker
+# procesa los mensajes en orden para que el 200 a Gupshup no espere a nada.
+WORK_QUEUE: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+
+
+def handle_incoming(waid: str, body_raw: str) -> None:
+    body = norm(body_raw)
+    log.info("Mensaje de %s: %s", waid, body)
+    s = get_session(waid)
+
+    # 0) Identificación inicial
+    is_number = _MENU_NUMBER_RE.fullmatch(body) is not None
+
+    if not s.get("club"):
+        mclubs = member_clubs(waid)
+        acls = admin_clubs(waid)
+        if len(mclubs) == 1:
+            set_session(waid, club=mclubs[0])
+        elif len(acls) == 1:
+            set_session(waid, club=acls[0])
+
+    current_cid = s.get("club") or infer_user_club(waid, extract_trailing_club_id(body_raw))
+    if current_cid and current_cid in _CTX:
+        ctx = _CTX[current_cid]
+    else:
+        ctx = None
+
+    # PRIORIDAD 2: Flujos awaiting (SIEMPRE antes de menús)
+    awaiting = s.get("awaiting")
+
+    # --- Flujo de invitación a rol (solo 1/2). Cualquier otra cosa re-muestra el prompt.
+    if awaiting == "invite_decision":
+        if body == "1":
+            buffer = s.get("buffer", {})
+            club_ctx = _CTX[buffer["club"]]
+            role_name = buffer["role"]
+            accept_msg = handle_accept(club_ctx, waid)
+            send_text(waid, accept_msg)
+
+            # Subflujos posteriores según rol (mantén exactamente los mismos emojis/estilo)
+            role_norm = role_name.lower()
+            st_now = club_ctx.state_store.load()
+            if "evaluador gramatical" in role_norm:
+                set_session(
+                    waid,
+                    awaiting="word_step1_palabra",
+                    buffer={"role": role_name, "waid": waid, "club": club_ctx.club_id, "round": st_now["round"]},
                 )
-                send_text(waid, resumen)
-                continue
-            # ============ FIN Temática de la Sesión ============
+                send_text(waid, "📖 Envía la palabra del día:")
+            elif "toastmaster" in role_norm or "toastmasters de la noche" in role_norm:
+                set_session(
+                    waid,
+                    awaiting="theme_step1_topic",
+                    buffer={"role": role_name, "waid": waid, "club": club_ctx.club_id, "round": st_now["round"]},
+                )
+                send_text(waid, "📝 Envía la temática de la sesión:")
+            else:
+                set_session(waid, awaiting=None, buffer=None, mode="root")
+                send_text(waid, render_root_menu(waid))
+            return
+
+        elif body == "2":
+            buffer = s.get("buffer", {})
+            club_ctx = _CTX[buffer["club"]]
+            reject_msg = handle_reject(club_ctx, waid)
+            send_text(waid, reject_msg)
+            set_session(waid, awaiting=None, buffer=None, mode="root")
+            send_text(waid, render_root_menu(waid))
+            return
 
-            # Si había awaiting pero no coincidió con ningún flujo, caemos a menús.
+        else:
+            buffer = s.get("buffer", {})
+            club_ctx = _CTX[buffer["club"]]
+            send_text(waid, "❗Opción inválida. Responde 1 (Aceptar) o 2 (Rechazar).")
+            send_text(waid, invite_text(club_ctx, buffer["role"], buffer["round"]))
+            return
+
+    # Agregar miembro
+    if awaiting == "admin_add_member" and s.get("mode") == "admin" and ctx:
+        m = _ADD_MEMBER_RE.match(body_raw.strip())
+        if not m:
+            send_text(waid, "Formato no válido. Usa: Nombre, 55XXXXXXXX")
+            return
+        out = admin_add_member(ctx, m.group("name"), m.group("num"))
+        send_text(waid, out)
+        set_session(waid, awaiting=None, buffer=None)
+        send_text(waid, render_admin_menu(ctx))
+        return
+
+    # Eliminar miembro
+    if awaiting == "admin_remove_member" and s.get("mode") == "admin" and ctx:
+        tail = body_raw.strip()
+        out = admin_remove_member(ctx, tail)
+        send_text(waid, out)
+        set_session(waid, awaiting=None, buffer=None)
+        send_text(waid, render_admin_menu(ctx))
+        return
+
+    # ============ FLUJOS: Palabra del Día / Temática (pasos de captura) ============
+    step = _CAPTURE_STEPS.get(awaiting) if awaiting else None
+    if step:
+        field, next_awaiting, reply = step
+        buffer = s.get("buffer", {})
+        buffer[field] = body_raw.strip()
+        set_session(waid, awaiting=next_awaiting, buffer=buffer)
+        send_text(waid, reply(buffer))
+        return
 
-            # PRIORIDAD 3: Router por sesión (menús numéricos)
-            if is_number:
-                # Menú raíz
-                if s.get("mode") == "root":
-                    idx = 1
+    if awaiting == "word_confirm" and is_number:
+        buffer = s.get("buffer", {})
+        if body == "1":
+            club_ctx = _CTX[buffer["club"]]
+            st = club_ctx.state_store.load()
+            st["word_of_the_day"] = {
+                "palabra": buffer["palabra"],
+                "significado": buffer["significado"],
+                "ejemplo": buffer["ejemplo"],
+                "waid": buffer["waid"],
+                "nombre": pretty_name(club_ctx, buffer["waid"]),
+                "round": buffer["round"]
+            }
+            club_ctx.state_store.save(st)
+            send_text(waid, f"✅ Palabra del día guardada: '{buffer['palabra']}'")
+            set_session(waid, awaiting=None, buffer=None, mode="root")
+            send_text(waid, render_root_menu(waid))
+            return
+        elif body == "2":
+            set_session(waid, awaiting="word_edit_palabra", buffer=buffer)
+            send_text(waid, f"📖 Palabra actual: {buffer['palabra']}\nEnvía la nueva palabra:")
+            return
+        elif body == "3":
+            set_session(waid, awaiting="word_edit_significado", buffer=buffer)
+            send_text(waid, f"✍️ Significado actual: {buffer['significado']}\nEnvía el nuevo significado:")
+            return
+        elif body == "4":
+            set_session(waid, awaiting="word_edit_ejemplo", buffer=buffer)
+            send_text(waid, f"💡 Ejemplo actual: {buffer['ejemplo']}\nEnvía el nuevo ejemplo:")
+            return
+        else:
+            send_text(waid, "Opción inválida. Envía 1, 2, 3 o 4.")
+            return
+
+    if awaiting == "theme_confirm" and is_number:
+        buffer = s.get("buffer", {})
+        if body == "1":
+            club_ctx = _CTX[buffer["club"]]
+            st = club_ctx.state_store.load()
+            st["session_theme"] = {
+                "topic": buffer["topic"],
+                "waid": buffer["waid"],
+                "nombre": pretty_name(club_ctx, buffer["waid"]),
+                "round": buffer["round"]
+            }
+            club_ctx.state_store.save(st)
+            send_text(waid, f"✅ Temática guardada: '{buffer['topic']}'")
+            set_session(waid, awaiting=None, buffer=None, mode="root")
+            send_text(waid, render_root_menu(waid))
+            return
+        elif body == "2":
+            set_session(waid, awaiting="theme_edit_topic", buffer=buffer)
+            send_text(waid, f"📝 Temática actual: {buffer['topic']}\nEnvía la nueva temática:")
+            return
+        else:
+            send_text(waid, "Opción inválida. Envía 1 o 2.")
+            return
+
+    # Si había awaiting pero no coincidió con ningún flujo, caemos a menús.
+
+    # PRIORIDAD 3: Router por sesión (menús numéricos)
+    if is_number:
+        # Menú raíz
+        if s.get("mode") == "root":
+            idx = 1
+            mclubs = member_clubs(waid)
+            aclubs = admin_clubs(waid)
+            if mclubs:
+                if body == str(idx):
+                    if len(mclubs) == 1:
+                        cid = mclubs[0]
+                        set_session(waid, mode="member", club=cid, awaiting=None)
+                        send_text(waid, render_member_menu(_CTX[cid])); return
+                    set_session(waid, mode="member_pick", awaiting="pick_member_club", club=None, buffer=None)
+                    send_text(waid, render_member_club_picker(mclubs)); return
+                idx += 1
+            if aclubs:
+                if len(aclubs) == 1:
+                    if body == str(idx):
+                        set_session(waid, mode="admin", club=aclubs[0], awaiting=None)
+                        send_text(waid, render_admin_menu(_CTX[aclubs[0]])); return
+                    idx += 1
+                else:
+                    if body == str(idx):
+                        set_session(waid, mode="admin_pick", awaiting="pick_admin_club")
+                        send_text(waid, render_admin_club_picker(aclubs)); return
+                    idx += 1
+            if body == str(idx):
+                # Mi estado de rol — resumen sin menús para evitar colisión
+                cid = s.get("club") or infer_user_club(waid)
+                if cid and cid in _CTX and len(member_clubs(waid)) <= 1:
+                    send_text(waid, who_am_i_summary(_CTX[cid], waid))
+                else:
                     mclubs = member_clubs(waid)
-                    aclubs = admin_clubs(waid)
                     if mclubs:
-                        if body == str(idx):
-                            if len(mclubs) == 1:
-                                cid = mclubs[0]
-                                set_session(waid, mode="member", club=cid, awaiting=None)
-                                send_text(waid, render_member_menu(_CTX[cid])); continue
-                            set_session(waid, mode="member_pick", awaiting="pick_member_club", club=None, buffer=None)
-                            send_text(waid, render_member_club_picker(mclubs)); continue
-                        idx += 1
-                    if aclubs:
-                        if len(aclubs) == 1:
-                            if body == str(idx):
-                                set_session(waid, mode="admin", club=aclubs[0], awaiting=None)
-                                send_text(waid, render_admin_menu(_CTX[aclubs[0]])); continue
-                            idx += 1
-                        else:
-                            if body == str(idx):
-                                set_session(waid, mode="admin_pick", awaiting="pick_admin_club")
-                                send_text(waid, render_admin_club_picker(aclubs)); continue
-                            idx += 1
-                    if body == str(idx):
-                        # Mi estado de rol — resumen sin menús para evitar colisión
-                        cid = s.get("club") or infer_user_club(waid)
-                        if cid and cid in _CTX and len(member_clubs(waid)) <= 1:
+                        lines = []
+                        for c in mclubs:
+                            lines.append(who_am_i_summary(_CTX[c], waid))
+                        send_text(waid, "\n".join(lines))
+                    else:
+                        if cid and cid in _CTX:
                             send_text(waid, who_am_i_summary(_CTX[cid], waid))
                         else:
-                            mclubs = member_clubs(waid)
-                            if mclubs:
-                                lines = []
-                                for c in mclubs:
-                                    lines.append(who_am_i_summary(_CTX[c], waid))
-                                send_text(waid, "\n".join(lines))
-                            else:
-                                if cid and cid in _CTX:
-                                    send_text(waid, who_am_i_summary(_CTX[cid], waid))
-                                else:
-                                    send_text(waid, "No se pudo determinar tu club. Pide a un admin que te agregue.")
-                        send_text(waid, render_root_menu(waid))
-                        continue
-
-                # Picker miembro multi-club
-                if s.get("mode") == "member_pick" and s.get("awaiting") == "pick_member_club":
-                    mclubs = member_clubs(waid)
-                    if not mclubs:
-                        set_session(waid, mode="root", awaiting=None, buffer=None, club=None)
-                        send_text(waid, render_root_menu(waid)); continue
-                    if body == "9":
-                        set_session(waid, mode="root", awaiting=None, buffer=None, club=None)
-                        send_text(waid, render_root_menu(waid)); continue
-                    try:
-                        idx = int(body) - 1
-                        cid = mclubs[idx]
-                        set_session(waid, mode="member", club=cid, awaiting=None, buffer=None)
-                        send_text(waid, render_member_menu(_CTX[cid])); continue
-                    except Exception:
-                        send_text(waid, render_member_club_picker(mclubs)); continue
-
-                # Picker admin multi-club
-                if s.get("mode") == "admin_pick" and s.get("awaiting") == "pick_admin_club":
-                    aclubs = admin_clubs(waid)
-                    if body == "9":
-                        set_session(waid, mode="root", awaiting=None, buffer=None)
-                        send_text(waid, render_root_menu(waid)); continue
-                    try:
-                        idx = int(body) - 1
-                        cid = aclubs[idx]
-                        set_session(waid, mode="admin", club=cid, awaiting=None)
-                        send_text(waid, render_admin_menu(_CTX[cid])); continue
-                    except Exception:
-                        send_text(waid, render_admin_club_picker(aclubs)); continue
-
-                # Menú miembro
-                if s.get("mode") == "member" and current_cid and current_cid in _CTX:
-                    ctx = _CTX[current_cid]
-                    if body == "1":
-                        send_text(waid, who_am_i(ctx, waid))
-                        send_text(waid, render_member_menu(ctx)); continue
-                    if body == "2":
-                        send_text(waid, status_text(ctx))
-                        send_text(waid, render_member_menu(ctx)); continue
-                    if body == "9":
-                        set_session(waid, mode="root", awaiting=None, buffer=None)
-                        send_text(waid, render_root_menu(waid)); continue
-
-                # Menú admin
-                if s.get("mode") == "admin" and current_cid and current_cid in _CTX:
-                    ctx = _CTX[current_cid]
-                    if body == "1":
-                        msg = start_new_round(ctx, pretty_name(ctx, waid))
-                        send_text(waid, msg)
-                        # Evita colisión: si ahora el admin tiene invitación pendiente o está en un flujo, no spamees el menú
-                        if not has_pending_invite(ctx, waid) and get_session(waid).get("awaiting") is None:
-                            send_text(waid, render_admin_menu(ctx))
-                        continue
-                    if body == "2":
-                        send_text(waid, status_text(ctx))
-                        send_text(waid, render_admin_menu(ctx)); continue
-                    if body == "3":
-                        send_text(waid, cancel_round(ctx, pretty_name(ctx, waid)))
-                        send_text(waid, render_admin_menu(ctx)); continue
-                    if body == "4":
-                        send_text(waid, reset_all(ctx, pretty_name(ctx, waid)))
-                        send_text(waid, render_admin_menu(ctx)); continue
-                    if body == "5":
-                        send_text(waid, admin_list_members(ctx))
-                        send_text(waid, render_admin_menu(ctx)); continue
-                    if body == "6":
-                        set_session(waid, awaiting="admin_add_member", buffer=None)
-                        send_text(waid, "✍️ Envía: Nombre, 55XXXXXXXX")
-                        continue
-                    if body == "7":
-                        set_session(waid, awaiting="admin_remove_member", buffer=None)
-                        send_text(waid, "✍️ Envía el número de 10 dígitos o el nombre exacto a eliminar")
-                        continue
-                    if body == "8":
-                        aclubs = admin_clubs(waid)
-                        if len(aclubs) > 1:
-                            set_session(waid, mode="admin_pick", awaiting="pick_admin_club")
-                            send_text(waid, render_admin_club_picker(aclubs)); continue
-                        send_text(waid, render_admin_menu(ctx)); continue
-                    if body == "9":
-                        set_session(waid, mode="root", awaiting=None, buffer=None)
-                        send_text(waid, render_root_menu(waid)); continue
-    
-
-            # PRIORIDAD 4: Comandos legacy
-
-            if body in ("mi rol", "mi rol?", "whoami"):
-                cid = infer_user_club(waid, extract_trailing_club_id(body_raw))
-                if cid and cid in _CTX:
-                    send_text(waid, who_am_i(_CTX[cid], waid))
-                else:
-                    send_text(waid, "No se pudo determinar tu club. Pide a un admin que te agregue.")
+                            send_text(waid, "No se pudo determinar tu club. Pide a un admin que te agregue.")
                 send_text(waid, render_root_menu(waid))
-                continue
+                return
+
+        # Picker miembro multi-club
+        if s.get("mode") == "member_pick" and s.get("awaiting") == "pick_member_club":
+            mclubs = member_clubs(waid)
+            if not mclubs:
+                set_session(waid, mode="root", awaiting=None, buffer=None, club=None)
+                send_text(waid, render_root_menu(waid)); return
+            if body == "9":
+                set_session(waid, mode="root", awaiting=None, buffer=None, club=None)
+                send_text(waid, render_root_menu(waid)); return
+            try:
+                idx = int(body) - 1
+                cid = mclubs[idx]
+                set_session(waid, mode="member", club=cid, awaiting=None, buffer=None)
+                send_text(waid, render_member_menu(_CTX[cid])); return
+            except Exception:
+                send_text(waid, render_member_club_picker(mclubs)); return
+
+        # Picker admin multi-club
+        if s.get("mode") == "admin_pick" and s.get("awaiting") == "pick_admin_club":
+            aclubs = admin_clubs(waid)
+            if body == "9":
+                set_session(waid, mode="root", awaiting=None, buffer=None)
+                send_text(waid, render_root_menu(waid)); return
+            try:
+                idx = int(body) - 1
+                cid = aclubs[idx]
+                set_session(waid, mode="admin", club=cid, awaiting=None)
+                send_text(waid, render_admin_menu(_CTX[cid])); return
+            except Exception:
+                send_text(waid, render_admin_club_picker(aclubs)); return
+
+        # Menú miembro
+        if s.get("mode") == "member" and current_cid and current_cid in _CTX:
+            action = MEMBER_MENU_DISPATCH.get(body)
+            if action:
+                action(_CTX[current_cid], waid)
+                return
+
+        # Menú admin
+        if s.get("mode") == "admin" and current_cid and current_cid in _CTX:
+            action = ADMIN_MENU_DISPATCH.get(body)
+            if action:
+                action(_CTX[current_cid], waid)
+                return
+
+
+    # PRIORIDAD 4: Comandos legacy
+
+    if body in WHOAMI_CMDS:
+        cid = infer_user_club(waid, extract_trailing_club_id(body_raw))
+        if cid and cid in _CTX:
+            send_text(waid, who_am_i(_CTX[cid], waid))
+        else:
+            send_text(waid, "No se pudo determinar tu club. Pide a un admin que te agregue.")
+        send_text(waid, render_root_menu(waid))
+        return
 
-            if body in ("acepto", "accept") and ctx:
-                send_text(waid, handle_accept(ctx, waid))
-                send_text(waid, render_root_menu(waid))
-                continue
+    if body in ACCEPT_CMDS and ctx:
+        send_text(waid, handle_accept(ctx, waid))
+        send_text(waid, render_root_menu(waid))
+        return
 
-            if body in ("rechazo", "reject") and ctx:
-                send_text(waid, handle_reject(ctx, waid))
-                send_text(waid, render_root_menu(waid))
-                continue
+    if body in REJECT_CMDS and ctx:
+        send_text(waid, handle_reject(ctx, waid))
+        send_text(waid, render_root_menu(waid))
+        return
 
-            # FALLBACK: menú principal
-            send_text(waid, render_root_menu(waid))
 
+    # FALLBACK: menú principal
+    send_text(waid, render_root_menu(waid))
+
+
+def _work_loop() -> None:
+    while True:
+        waid, body_raw = WORK_QUEUE.get()
+        try:
+            handle_incoming(waid, body_raw)
+        except Exception:
+            log.exception("Error procesando mensaje de %s", waid)
+        finally:
+            WORK_QUEUE.task_done()
+
+
+Thread(target=_work_loop, daemon=True, name="webhook-worker").start()
+
+
+def _extract_messages(data: dict) -> list:
+    # EAFP: el 99% de los payloads trae la forma feliz; un try/except sale más
+    # barato que la cadena de .get con listas/dicts default por mensaje.
+    try:
+        return data["entry"][0]["changes"][0]["value"].get("messages", [])
+    except (KeyError, IndexError, TypeError):
+        return []
+
+
+@app.route("/webhook", methods=["POST"])
+def webhook_post():
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        for msg in _extract_messages(data):
+            if msg.get("type") != "text":
+                continue
+            waid = msg.get("from", "")
+            body_raw = msg.get("text", {}).get("body", "")
+            if not waid:
+                continue
+            WORK_QUEUE.put((waid, body_raw))
     except Exception:
         log.exception("Error procesando webhook; payload=%s", data)
 
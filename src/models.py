@@ -30,6 +30,12 @@ app.py → usa Club para leer/actualizar club.json en tiempo de ejecución
 import json
 from pathlib import Path
 
+try:
+    # (De)serialización JSON en C; opcional, con fallback al json estándar.
+    import orjson
+except ImportError:
+    orjson = None
+
 class Role:
     def __init__(self, name: str, difficulty: int):
         """
@@ -125,10 +131,16 @@ class Club:
             "members": [m.to_dict() for m in self.members],
             "roles": [r.to_dict() for r in self.roles],
         }
-        Path(filepath).write_text(
-            json.dumps(data, indent=2, ensure_ascii=False),
-            encoding="utf-8"
-        )
+        if orjson is not None:
+            # orjson emite UTF-8 directo (sin escapar acentos), igual que
+            # ensure_ascii=False; se conserva el indentado porque club.json
+            # se edita a mano.
+            Path(filepath).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        else:
+            Path(filepath).write_text(
+                json.dumps(data, indent=2, ensure_ascii=False),
+                encoding="utf-8"
+            )
 
     def load_from_json(self, filepath="data/club.json"):
         """
@@ -144,6 +156,6 @@ class Club:
             # Reescribimos en UTF-8 para normalizar a futuro
             p.write_text(raw, encoding="utf-8")
 
-        data = json.loads(raw)
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
         self.members = [Member.from_dict(m) for m in data.get("members", [])]
         self.roles = [Role.from_dict(r) for r in data.get("roles", [])]
@@ -0,0 +1,14 @@
+# wsgi.py
+# Punto de entrada WSGI para producción (desde la raíz del repo):
+#
+#   gunicorn --pythonpath src -w 1 -k gthread --threads 8 -b 0.0.0.0:$PORT wsgi:app
+#
+# Correr desde la raíz importa: CLUBS_DIR y SESSION_DB_PATH apuntan por
+# defecto a rutas relativas bajo data/; con cwd=src/ el bot arranca sin
+# clubes. Si necesitas otro cwd, define ambas variables con rutas absolutas.
+#
+# Un solo worker: el ciclo cargar→mutar→guardar del estado se serializa con
+# los locks del proceso; el flock solo protege cada escritura individual, así
+# que con varios procesos dos eventos del mismo club pueden pisarse.
+
+from app import app  # noqa: F401